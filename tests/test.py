@@ -4,6 +4,8 @@ import os
 import clingo
 import pandas as pd
 import subprocess
+import json
+import zipfile
 
 
 class Context:
@@ -16,13 +18,14 @@ class Context:
 # ------------------------ Ultis functions
 
 
-def call_xls2asp(silent=False):
+def call_xls2asp(silent=False, options=()):
     command = 'python xls2asp.py --xls tests/tmp/data.xlsx --template ./tests/tmp/template.txt --output ./tests/tmp/output.lp'
+    command = command.split() + list(options)
     if silent:
         command_status = subprocess.call(
-            command.split(), stderr=subprocess.DEVNULL)
+            command, stderr=subprocess.DEVNULL)
     else:
-        command_status = subprocess.call(command.split())
+        command_status = subprocess.call(command)
     return command_status
 
 
@@ -78,3 +81,226 @@ def test_time_iso():
     make_template(
         [['Sheet1', 'row_indexed', 'time']])
     assert call_xls2asp(silent=True) != 0
+
+
+def test_diagnostics():
+    make_excel([['a', 1], [None, None], [None, None], ['b', 2], [None, None]])
+    make_template(
+        [['Sheet1', 'row', 'constant', 'int']])
+    assert call_xls2asp(silent=True, options=[
+        '--max-warnings', '1', '--diagnostics', './tests/tmp/diagnostics.json']) == 0
+    check_in_facts('sheet1(b,2)')
+    with open('./tests/tmp/diagnostics.json') as f:
+        diagnostics = json.load(f)
+    os.remove('./tests/tmp/diagnostics.json')
+    assert diagnostics['count'] == 3
+    assert diagnostics['warnings'][0]['kind'] == 'empty_row'
+    assert diagnostics['warnings'][0]['count'] == 3
+    assert len(diagnostics['warnings'][0]['examples']) == 1
+    assert call_xls2asp(silent=True, options=['--max-warnings', '-1']) == 2
+
+
+def test_validate():
+    make_excel([['a', 1], ['B', 2], ['c', 'x'], ['d', 'y']])
+    make_template(
+        [['Sheet1', 'row', 'constant', 'int']])
+    command = 'python xls2asp.py --xls tests/tmp/data.xlsx --template ./tests/tmp/template.txt --validate'
+    result = subprocess.run(command.split(), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 1
+    assert result.stdout == ''
+    assert result.stderr.count('ERROR: ') == 3
+    assert 'row "3" column "A"' in result.stderr
+    assert 'row "4" column "B"' in result.stderr
+    assert 'row "5" column "B"' in result.stderr
+
+    result = subprocess.run(command.split() + ['--max-errors', '1'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 1
+    assert result.stderr.count('ERROR: ') == 1
+    assert 'Stopped after' in result.stderr
+
+    result = subprocess.run(command.split() + ['--max-errors', '3'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 1
+    assert result.stderr.count('ERROR: ') == 3
+    assert 'Stopped after' not in result.stderr
+
+    assert subprocess.call(command.split() + ['--max-errors', '0'],
+                           stderr=subprocess.DEVNULL) == 2
+
+    make_excel([['a', 1], ['b', 2]])
+    result = subprocess.run(command.split() + ['--max-errors', '1'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0
+    assert 'ERROR: ' not in result.stderr
+    assert 'Stopped after' not in result.stderr
+
+
+def test_csv_and_template_cache():
+    with open('./tests/tmp/data.csv', 'w') as f:
+        f.write('first,last,age\nDany,Hans,20\n,,\nManuel,Vardi,50\nLea,Berg\n')
+    make_template(
+        [['data', 'row', 'string', 'string', 'int = none']])
+    command = ['python', '-X', 'importtime', 'xls2asp.py', '--xls', './tests/tmp/data.csv',
+               '--template', './tests/tmp/template.txt', '--output', './tests/tmp/output.lp',
+               '--template-cache', './tests/tmp/template.cache']
+    for i in range(2):
+        result = subprocess.run(command, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        assert result.returncode == 0
+        assert 'openpyxl' not in result.stderr
+        check_in_facts('data("Manuel","Vardi",50)')
+        check_in_facts('data("Lea","Berg",none)')
+    os.remove('./tests/tmp/data.csv')
+    os.remove('./tests/tmp/template.cache')
+
+
+def test_csv_ragged_rows_and_dates():
+    with open('./tests/tmp/data.csv', 'w') as f:
+        f.write('first,last,age,birth,registered\nDany,Hans\nManuel,Vardi,50,1970-05-01,2020-01-02T10:30:00\n')
+    make_template(
+        [['data', 'row', 'string', 'string', 'int = none', 'date = none', 'datetime = none']])
+    command = ['python', 'xls2asp.py', '--xls', './tests/tmp/data.csv',
+               '--template', './tests/tmp/template.txt', '--output', './tests/tmp/output.lp']
+    assert subprocess.call(command) == 0
+    check_in_facts('data("Dany","Hans",none,none,none)')
+    check_in_facts('data("Manuel","Vardi",50,(1,5,1970),((2,1,2020),(10,30,0)))')
+
+    make_template(
+        [['data', 'row', 'string', 'string', 'int', 'date', 'datetime']])
+    result = subprocess.run(command[:-2] + ['--validate'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    os.remove('./tests/tmp/data.csv')
+    assert result.returncode == 1
+    assert result.stderr.count('ERROR: ') == 3
+    assert 'row "2" column "C"' in result.stderr
+
+
+def test_iso_dates_only_in_csv():
+    with open('./tests/tmp/data.csv', 'w') as f:
+        f.write('birth,registered\n1970-05-01,2020-01-02\n')
+    make_template(
+        [['data', 'row', 'date', 'datetime']])
+    command = ['python', 'xls2asp.py', '--xls', './tests/tmp/data.csv',
+               '--template', './tests/tmp/template.txt', '--validate']
+    result = subprocess.run(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    os.remove('./tests/tmp/data.csv')
+    assert result.stderr.count('ERROR: ') == 1
+    assert 'column "B": Expecting a datetime' in result.stderr
+
+    make_excel([['1970-05-01', '2020-01-02T10:30:00']])
+    make_template(
+        [['Sheet1', 'row', 'date', 'datetime']])
+    assert call_xls2asp(silent=True, options=['--validate']) == 1
+
+
+def test_check_template():
+    make_template(
+        [['Sheet1', 'row', 'string', 'int']])
+    command = 'python xls2asp.py --template ./tests/tmp/template.txt --check-template'
+    assert subprocess.call(command.split()) == 0
+    result = subprocess.run(command.split() + ['--template-cache', './tests/tmp/missing/template.cache'],
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0
+    assert 'Could not write template cache' in result.stderr
+    make_template(
+        [['Sheet1', 'row', 'string', 'integer']])
+    assert subprocess.call(command.split(), stderr=subprocess.DEVNULL) != 0
+
+
+def test_aspif():
+    make_excel([['Dany', 'a;b', 20], ['Manuel', 'c', 50]])
+    make_template(
+        [['Sheet1', 'row_indexed', 'string', 'constant', 'int']])
+    assert call_xls2asp(options=['--format', 'aspif']) == 0
+    with open('./tests/tmp/output.lp') as f:
+        assert f.readline() == 'asp 1 0 0\n'
+    ctl = clingo.Control()
+    ctl.load("./tests/tmp/output.lp")
+    ctl.ground([("base", [])])
+    models = []
+    ctl.solve(on_model=lambda m: models.append(
+        set(str(s) for s in m.symbols(shown=True))))
+    assert models == [{'sheet1(0,"Dany",a,20)', 'sheet1(0,"Dany",b,20)',
+                       'sheet1(1,"Manuel",c,50)'}]
+
+
+def test_sheet_selection():
+    with pd.ExcelWriter("./tests/tmp/data.xlsx") as writer:
+        pd.DataFrame([['Dany', 20]]).to_excel(
+            writer, sheet_name='People', index=False)
+        pd.DataFrame([['x', 'y']]).to_excel(
+            writer, sheet_name='Other', index=False)
+    make_template(
+        [['People', 'row', 'string', 'int'], ['Other', 'row', 'int', 'int'], ['Missing', 'row', 'int', 'int']])
+    assert call_xls2asp(silent=True) != 0
+    assert call_xls2asp(options=['--only-sheets', 'People']) == 0
+    check_in_facts('people("Dany",20)')
+    assert call_xls2asp(
+        options=['--exclude-sheets', 'Other', 'Missing']) == 0
+    check_in_facts('people("Dany",20)')
+
+    assert call_xls2asp(silent=True, options=['--only-sheets', 'Nosuch']) == 2
+    assert call_xls2asp(silent=True, options=['--exclude-sheets', 'Nosuch']) == 2
+
+    command = 'python xls2asp.py --xls tests/tmp/data.xlsx --template ./tests/tmp/template.txt --sheet-index --exclude-sheets Other'
+    result = subprocess.run(command.split(), stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    assert result.returncode == 0
+    lines = result.stdout.splitlines()
+    assert lines[1].split()[0:2] == ['People', 'A1:B2']
+    assert lines[1].split()[-1] == 'row'
+    assert lines[2].split()[-1] == 'excluded'
+
+
+def test_diagnostics_bad_path():
+    make_excel([['a', 1], [None, None], ['b', 2]])
+    make_template(
+        [['Sheet1', 'row', 'constant', 'int']])
+    assert call_xls2asp(silent=True, options=[
+        '--diagnostics', './tests/tmp/missing/diagnostics.json']) == 0
+
+
+def test_sheet_selection_renamed_workbook_part():
+    make_excel([['Dany', 20]])
+    make_template(
+        [['Sheet1', 'row', 'string', 'int']])
+    with zipfile.ZipFile("./tests/tmp/data.xlsx") as source:
+        files = [(info.filename, source.read(info))
+                 for info in source.infolist()]
+    with zipfile.ZipFile("./tests/tmp/data.xlsx", "w", zipfile.ZIP_DEFLATED) as target:
+        for name, data in files:
+            name = name.replace("xl/workbook.xml", "xl/book.xml")
+            name = name.replace("xl/_rels/workbook.xml", "xl/_rels/book.xml")
+            data = data.replace(b"/xl/workbook.xml", b"/xl/book.xml")
+            data = data.replace(b"xl/workbook.xml", b"xl/book.xml")
+            target.writestr(name, data)
+    assert call_xls2asp() == 0
+    check_in_facts('sheet1("Dany",20)')
+    assert call_xls2asp(options=['--only-sheets', 'Sheet1']) == 0
+    check_in_facts('sheet1("Dany",20)')
+
+
+def test_excluded_sheet_not_read():
+    with pd.ExcelWriter("./tests/tmp/data.xlsx") as writer:
+        pd.DataFrame([['Dany', 20]]).to_excel(
+            writer, sheet_name='People', index=False)
+        pd.DataFrame([[1, 2]]).to_excel(
+            writer, sheet_name='Other', index=False)
+    make_template(
+        [['People', 'row', 'string', 'int'], ['Other', 'row', 'int', 'int']])
+    with zipfile.ZipFile("./tests/tmp/data.xlsx") as source:
+        files = [(info.filename, source.read(info))
+                 for info in source.infolist()]
+    # break the xml of the second sheet, reading it fails
+    with zipfile.ZipFile("./tests/tmp/data.xlsx", "w", zipfile.ZIP_DEFLATED) as target:
+        for name, data in files:
+            if name == "xl/worksheets/sheet2.xml":
+                data = b"broken"
+            target.writestr(name, data)
+    assert call_xls2asp(silent=True) != 0
+    assert call_xls2asp(silent=True, options=['--only-sheets', 'Other']) != 0
+    assert call_xls2asp(options=['--exclude-sheets', 'Other']) == 0
+    check_in_facts('people("Dany",20)')
@@ -12,8 +12,8 @@ import warnings
 import csv
 import argparse
 import sys
-import traceback
-import openpyxl as xls
+import os
+import marshal
 import math
 import warnings
 import re
@@ -24,6 +24,8 @@ from operator import itemgetter
 list_of_styles = ["sparse_matrix_xy", "matrix_xy", "row", "row_indexed"]
 list_of_types = ["auto_detect", "skip", "int",
                  "constant", "time", "date", "datetime", "string"]
+# increase when Template.read changes the template it builds or checks
+template_cache_version = 1
 
 
 def write_category_comment(output, pred):
@@ -32,6 +34,23 @@ def write_category_comment(output, pred):
     output.write('%' * (len(pred) + 6) + '\n')
 
 
+def write_sheet_index(output, sheets, reader):
+    output.write("{:<31} {:>15} {:>12} {:>12}  {}\n".format(
+        "Sheet", "Dimension", "XML size", "Compressed", "Style"))
+    for sheet in sheets:
+        if not reader.is_selected(sheet["sheet"]):
+            style = "excluded"
+        elif sheet["sheet"] not in reader.instance.template:
+            style = "skip"
+        else:
+            style = reader.instance.template[sheet["sheet"]]["style"]
+        dimension = sheet["dimension"]
+        if dimension == None:
+            dimension = "?"
+        output.write("{:<31} {:>15} {:>12} {:>12}  {}\n".format(
+            sheet["sheet"], dimension, sheet["size"], sheet["compressed_size"], style))
+
+
 class Xls2AspError(ValueError):
     def __init__(self, msg, sheet="?", cell=(1, 0)):
         super(Xls2AspError, self).__init__(msg)
@@ -48,14 +67,67 @@ class TableNameError(ValueError):
 class SheetRowColumnWrongTypeValueError(ValueError):
     def __init__(self, table, row, col, msg, value=None):
         ValueError.__init__(self, 'Wrong type in sheet "{}" row "{}" column "{}": {}'.format(
-            table, row, xls.utils.cell.get_column_letter(col+1), msg), value)
+            table, row, Conversion.col2letter(col+1), msg), value)
+
+
+class ValidationLimitReached(Exception):
+    pass
+
+
+class Diagnostics:
+    """
+    Collects warnings by kind and sheet and reports them as a summary
+    """
+
+    def __init__(self, max_examples=10):
+        self.max_examples = max_examples
+        self.warnings = {}
+
+    def warn(self, kind, sheet, msg, *args):
+        """
+        Counts a warning, only the first max_examples messages of every
+        kind and sheet are formatted from msg and args and kept
+        """
+        entry = self.warnings.setdefault(
+            (kind, sheet), {"count": 0, "examples": []})
+        entry["count"] += 1
+        if len(entry["examples"]) < self.max_examples:
+            entry["examples"].append(msg.format(*args))
+
+    def count(self):
+        return sum(entry["count"] for entry in self.warnings.values())
+
+    def write_summary(self, file):
+        for (kind, sheet), entry in self.warnings.items():
+            for msg in entry["examples"]:
+                file.write("WARNING: "+msg+"\n")
+            hidden = entry["count"] - len(entry["examples"])
+            if hidden > 0:
+                file.write("WARNING: {} more warnings of kind \"{}\" in sheet \"{}\" not shown\n".format(
+                    hidden, kind, sheet))
+
+    def write_json(self, file):
+        import json
+        warnings = []
+        for (kind, sheet), entry in self.warnings.items():
+            warnings.append({"kind": kind, "sheet": sheet,
+                             "count": entry["count"], "examples": entry["examples"]})
+        json.dump({"count": self.count(), "warnings": warnings}, file, indent=2)
+        file.write("\n")
 
 
 class Conversion:
 
     @staticmethod
     def col2letter(col):
-        return xls.utils.cell.get_column_letter(col)
+        """
+        converts a 1-based column index to its excel letters
+        """
+        letters = ""
+        while col > 0:
+            col, rem = divmod(col - 1, 26)
+            letters = chr(ord("A") + rem) + letters
+        return letters
 
     @staticmethod
     def date2tuple(value):
@@ -69,6 +141,28 @@ class Conversion:
     def time2tuple(value):
         return "("+str(value.hour)+","+str(value.minute)+","+str(value.second)+")"
 
+    @staticmethod
+    def iso2date(value):
+        """
+        parses an ISO date, other values are returned unchanged
+        """
+        try:
+            return datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            return value
+
+    @staticmethod
+    def iso2datetime(value):
+        """
+        parses an ISO date with a time, a date alone is not taken as midnight
+        """
+        if isinstance(Conversion.iso2date(value), datetime.date):
+            return value
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return value
+
     @staticmethod
     def is_int(value):
         return Conversion.is_single_int(value) or Conversion.is_set_of_int(value)
@@ -165,6 +259,47 @@ class Conversion:
         else:
             return "("+value+")"
 
+    @staticmethod
+    def unpool(term):
+        """
+        expands the pools of a ground term like p(a,(b;c)) into the list of its terms
+        """
+        groups = []
+        quoted = False
+        escaped = False
+        for i, c in enumerate(term):
+            if quoted:
+                if escaped:
+                    escaped = False
+                elif c == "\\":
+                    escaped = True
+                elif c == "\"":
+                    quoted = False
+            elif c == "\"":
+                quoted = True
+            elif c == "(":
+                groups.append({"open": i, "pool": [], "tuple": []})
+            elif c == ";" and groups:
+                groups[-1]["pool"].append(i)
+            elif c == "," and groups:
+                groups[-1]["tuple"].append(i)
+            elif c == ")" and groups:
+                group = groups.pop()
+                if group["pool"]:
+                    open = group["open"]
+                    function = open > 0 and (
+                        term[open-1].isalnum() or term[open-1] in "_'")
+                    bounds = [open] + group["pool"] + [i]
+                    terms = []
+                    for start, end in zip(bounds, bounds[1:]):
+                        element = term[start+1:end]
+                        if function or any(start < pos < end for pos in group["tuple"]):
+                            element = "("+element+")"
+                        terms.extend(Conversion.unpool(
+                            term[:open]+element+term[i+1:]))
+                    return terms
+        return [term]
+
 
 class Template:
     """
@@ -207,6 +342,37 @@ class Template:
                     self.add_default(table, default)
             f.close()
 
+    def read_cached(self, fileName, cacheName):
+        """
+        Reads the template from cacheName if it was written for the current
+        version of fileName, otherwise reads fileName and updates the cache
+        """
+        stat = os.stat(fileName)
+        key = [template_cache_version, os.path.abspath(fileName),
+               stat.st_mtime_ns, stat.st_size, sys.hexversion]
+        try:
+            with open(cacheName, "rb") as f:
+                cache = marshal.load(f)
+            if cache["key"] == key:
+                self.template = cache["template"]
+                return
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+        self.read(fileName)
+        # the cache is optional, and replaced at once for concurrent runs
+        tmpName = "{}.{}.tmp".format(cacheName, os.getpid())
+        try:
+            with open(tmpName, "wb") as f:
+                marshal.dump({"key": key, "template": self.template}, f)
+            os.replace(tmpName, cacheName)
+        except OSError as e:
+            sys.stderr.write(
+                "*** Could not write template cache: {}\n".format(e))
+            try:
+                os.remove(tmpName)
+            except OSError:
+                pass
+
     def add_table(self, table):
         """
         Adds a table and ensures it is unique
@@ -232,9 +398,14 @@ class Instance:
     Class for maintaining data of an instance file
     """
 
-    def __init__(self, template):
+    def __init__(self, template, diagnostics=None):
         self.data = {}
         self.template = template
+        if diagnostics == None:
+            diagnostics = Diagnostics()
+        self.diagnostics = diagnostics
+        self.errors = None
+        self.max_errors = None
 
     def add_table(self, table):
         """
@@ -271,11 +442,23 @@ class Instance:
         """
         self.data.setdefault(table, {}).setdefault("style", style)
 
+    def add_text(self, table):
+        """
+        Marks a table read from text, whose dates are given in ISO format
+        """
+        self.data.setdefault(table, {}).setdefault("text", True)
+
+    def is_text(self, table):
+        return self.data[table].get("text", False)
+
     def add_row(self, table, id, row):
         self.data.setdefault(table, {}).setdefault(
             "rows", {}).setdefault(id, row)
 
-    def write(self, file):
+    def write(self, file, format="lp"):
+        if format == "aspif":
+            self.write_aspif(file)
+            return
         for table in self.data:
             style = self.data[table]["style"]
             if style in ["row", "row_indexed"]:
@@ -284,11 +467,53 @@ class Instance:
                 self.write_table_matrix_xy_style(
                     table, file, style == 'sparse_matrix_xy')
 
+    def write_aspif(self, file):
+        """
+        Writes all tables as an aspif program of facts,
+        every atom is given its symbol by an output statement
+        """
+        atoms = {}
+        file.write("asp 1 0 0\n")
+        for table in self.data:
+            style = self.data[table]["style"]
+            if style in ["row", "row_indexed"]:
+                facts = self.get_facts_row_style(table, style == 'row_indexed')
+            elif style in ["matrix_xy", "sparse_matrix_xy"]:
+                facts = self.get_facts_matrix_xy_style(
+                    table, style == 'sparse_matrix_xy')
+            for fact in facts:
+                for symbol in Conversion.unpool(fact):
+                    if symbol not in atoms:
+                        atoms[symbol] = len(atoms) + 1
+                        file.write("1 0 1 {} 0 0\n".format(atoms[symbol]))
+                        file.write("4 {} {} 1 {}\n".format(
+                            len(symbol.encode("utf8")), symbol, atoms[symbol]))
+        file.write("0\n")
+
     def write_table_row_style(self, table, file, prefix_index_argument=False):
         """
         Writes table content to facts row by row
         """
         write_category_comment(file, table)
+        for fact in self.get_facts_row_style(table, prefix_index_argument):
+            file.write(fact+'.\n')
+        file.write('\n')
+        file.write('\n')
+
+    def write_table_matrix_xy_style(self, table, file, sparse=False):
+        """
+        Writes table content to facts
+        """
+        write_category_comment(file, table)
+        for fact in self.get_facts_matrix_xy_style(table, sparse):
+            file.write(fact+'.\n')
+        file.write('\n')
+        file.write('\n')
+
+    def get_facts_row_style(self, table, prefix_index_argument=False):
+        """
+        Generates the facts of a table row by row
+        """
         for index, row in enumerate(self.data[table]["rows"], 0):
             pred = table+'('
             if prefix_index_argument:
@@ -297,16 +522,13 @@ class Instance:
                 if not self.is_skip(table, col):
                     pred += str(self.data[table]["rows"][row][col])+','
             pred = pred[0:len(pred)-1]
-            pred += ').\n'
-            file.write(pred)
-        file.write('\n')
-        file.write('\n')
+            pred += ')'
+            yield pred
 
-    def write_table_matrix_xy_style(self, table, file, sparse=False):
+    def get_facts_matrix_xy_style(self, table, sparse=False):
         """
-        Writes table content to facts
+        Generates the facts of a table cell by cell
         """
-        write_category_comment(file, table)
         for r in self.data[table]["rows"]:
             if r != 1:
                 y = self.data[table]["rows"][r][0]
@@ -317,10 +539,8 @@ class Instance:
                                 '('+str(self.data[table]["rows"][1][col])+','
                             pred += str(y)+','
                             pred += str(self.data[table]
-                                        ["rows"][r][col])+').\n'
-                            file.write(pred)
-        file.write('\n')
-        file.write('\n')
+                                        ["rows"][r][col])+')'
+                            yield pred
 
     def get_test(self, type):
         if type == "int":
@@ -344,34 +564,34 @@ class Instance:
         else:
             raise ValueError('Type not valid: '+type)
 
-    def test_string(self, table, row, col, value, default):
+    def test_string(self, table, row, col, value, default, convert=True):
         if value == None and default != None:
             return default
         if isinstance(value, str):
-            return Conversion.normalize_string(value)
+            return Conversion.normalize_string(value) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a string, getting:", value)
 
-    def test_int(self, table, row, col, value, default):
+    def test_int(self, table, row, col, value, default, convert=True):
         if value == None and default != None:
             return default
         if Conversion.is_int(value):
-            return Conversion.normalize_int(value)
+            return Conversion.normalize_int(value) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting an int, getting:", value)
 
-    def test_constant(self, table, row, col, value, default=None):
+    def test_constant(self, table, row, col, value, default=None, convert=True):
         if value == None and default != None:
             return default
         if Conversion.is_asp_constant(value):
-            return Conversion.normalize_constant(value)
+            return Conversion.normalize_constant(value) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a constant, getting:", value)
 
-    def test_time(self, table, row, col, value, default):
+    def test_time(self, table, row, col, value, default, convert=True):
         if value == None and default != None:
             return default
         if not isinstance(value, datetime.time):
@@ -380,65 +600,99 @@ class Instance:
             except Exception:
                 pass
         if isinstance(value, datetime.time):
-            return Conversion.time2tuple(value)
+            return Conversion.time2tuple(value) if convert else value
         if value == datetime.datetime(1899, 12, 30, 0, 0):
-            print(
-                "Warning in table", table, "row ", row, "col ", col)
-            print("Expected a time, getting:", value)
-            print(
-                "This could a know XLS error for times like 00:00:00, treating this as datetime.time(00:00:00).")
+            self.diagnostics.warn("time_as_datetime", table,
+                                  "Expected a time in sheet \"{}\" row {} column {}, getting: {}. "
+                                  "This could be a known XLS error for times like 00:00:00, treating it as (0,0,0)",
+                                  table, row, Conversion.col2letter(col+1), value)
             return "(0,0,0)"
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a time, getting:", value)
 
-    def test_time2min(self, table, row, col, value, default=None):
+    def test_time2min(self, table, row, col, value, default=None, convert=True):
         if value == None and default != None:
             return default
         if isinstance(value, datetime.time):
-            return str(value.hour)+"*60+"+str(value.minute)
+            return str(value.hour)+"*60+"+str(value.minute) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a time, getting:", value)
 
-    def test_datetime(self, table, row, col, value, default=None):
+    def test_datetime(self, table, row, col, value, default=None, convert=True):
         if value == None and default != None:
             return default
+        if not isinstance(value, datetime.datetime) and self.is_text(table):
+            value = Conversion.iso2datetime(value)
         if isinstance(value, datetime.datetime):
-            return Conversion.datetime2tuple(value)
+            return Conversion.datetime2tuple(value) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a datetime, getting:", value)
 
-    def test_date(self, table, row, col, value, default=None):
+    def test_date(self, table, row, col, value, default=None, convert=True):
 
         if value == None and default != None:
             return default
+        if not isinstance(value, datetime.date) and self.is_text(table):
+            value = Conversion.iso2date(value)
         if isinstance(value, datetime.date):
-            return Conversion.date2tuple(value)
+            return Conversion.date2tuple(value) if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "Expecting a date, getting:", value)
 
-    def test_auto_detect(self, table, row, col, value, default=None):
+    def test_auto_detect(self, table, row, col, value, default=None, convert=True):
         if value == None and default != None:
             return default
         if Conversion.is_int(value):
-            return Conversion.normalize_int(value)
+            return Conversion.normalize_int(value) if convert else value
         elif isinstance(value, datetime.time):
-            return Conversion.time2tuple(value)
+            return Conversion.time2tuple(value) if convert else value
         elif isinstance(value, datetime.datetime):
-            return Conversion.datetime2tuple(value)
+            return Conversion.datetime2tuple(value) if convert else value
         elif isinstance(value, datetime.date):
-            return Conversion.date2tuple(value)
+            return Conversion.date2tuple(value) if convert else value
         if Conversion.is_asp_constant(value):
-            return Conversion.normalize_constant(value)
+            return Conversion.normalize_constant(value) if convert else value
         elif isinstance(value, str):
-            return "\""+value+"\""
+            return "\""+value+"\"" if convert else value
         else:
             raise SheetRowColumnWrongTypeValueError(
                 table, row, col, "A value is expected", value)
 
+    def check(self, test, table, row, col, value, default):
+        """
+        Applies a type test to a value. When validating, the value is only
+        checked and left unchanged, wrong types are collected instead of raised
+        """
+        if self.errors == None:
+            return test(table, row, col, value, default)
+        try:
+            test(table, row, col, value, default, convert=False)
+        except SheetRowColumnWrongTypeValueError as e:
+            if len(self.errors) >= self.max_errors:
+                raise ValidationLimitReached()
+            self.errors.append(e)
+        return value
+
+    def validate(self, max_errors=100):
+        """
+        Type checks all tables without converting them and returns the list
+        of errors, at most max_errors, and whether this limit was reached
+        """
+        self.errors = []
+        self.max_errors = max_errors
+        limit_reached = False
+        try:
+            self.correct()
+        except ValidationLimitReached:
+            limit_reached = True
+        errors = self.errors
+        self.errors = None
+        return errors, limit_reached
+
     def correct(self):
         # correct table names
         data = {}
@@ -481,8 +735,8 @@ class Instance:
                 unexpected = 1
                 self.data[table]["rows"][row] = self.data[table]["rows"][row][0:nb_col]
         if unexpected:
-            sys.stderr.write(
-                "WARNING: Undefined column in sheet \""+table+"\", ignoring it\n")
+            self.diagnostics.warn("undefined_column", table,
+                                  "Undefined column in sheet \"{}\", ignoring it", table)
         col = 0
         for i in range(len(self.template[table]["types"])):
             type = self.template[table]["types"][i]
@@ -493,8 +747,8 @@ class Instance:
                 test = self.get_test(type)
                 for row in self.data[table]["rows"]:
                     value = self.data[table]["rows"][row][col]
-                    self.data[table]["rows"][row][col] = test(
-                        table, row, col, value, default)
+                    self.data[table]["rows"][row][col] = self.check(
+                        test, table, row, col, value, default)
             col += 1
 
     def correct_matrix_xy_style(self, table, sparse=False):
@@ -515,14 +769,15 @@ class Instance:
         # for i in range(1,len(row_x)):
         for col in range(1, len(row_x)):
             if not self.is_skip(table, col):
-                row_x[col] = test(table, 1, col, row_x[col], default_x)
+                row_x[col] = self.check(
+                    test, table, 1, col, row_x[col], default_x)
 
         # test type for y (= first column)
         test = self.get_test(type_y)
         for r in self.data[table]["rows"]:
             if r != 1:
-                self.data[table]["rows"][r][0] = test(
-                    table, r, 0, self.data[table]["rows"][r][0], default_y)
+                self.data[table]["rows"][r][0] = self.check(
+                    test, table, r, 0, self.data[table]["rows"][r][0], default_y)
 
         # test type for the inner matrix
         test = self.get_test(type_v)
@@ -531,13 +786,13 @@ class Instance:
                 for col in range(1, len(self.data[table]["rows"][r])):
                     if not self.is_skip(table, col):
                         if not sparse or self.data[table]["rows"][r][col] != None:
-                            self.data[table]["rows"][r][col] = test(
-                                table, r, col, self.data[table]["rows"][r][col], default_v)
+                            self.data[table]["rows"][r][col] = self.check(
+                                test, table, r, col, self.data[table]["rows"][r][col], default_v)
 
     def get_table_style(self, table):
         if table not in self.template:
-            sys.stderr.write("WARNING: Sheet \""+table +
-                             "\" is not defined in the template\n")
+            self.diagnostics.warn("undefined_sheet", table,
+                                  "Sheet \"{}\" is not defined in the template", table)
             return "skip"
         style = self.template[table]["style"]
         return style
@@ -553,8 +808,8 @@ class Instance:
                 list_empty.append(row)
         for row in list_empty:
             self.data[table]["rows"].pop(row)
-            sys.stderr.write("WARNING: Row "+str(row) +
-                             " in sheet \""+table+"\"is empty, ignoring it\n")
+            self.diagnostics.warn("empty_row", table,
+                                  "Row {} in sheet \"{}\" is empty, ignoring it", row, table)
 
     def locate_empty_column(self, table):
         self.add_skip(table)
@@ -567,51 +822,168 @@ class Instance:
             if empty:
                 self.add_skip(table, col)
         for col in self.data[table]["skip"]:
-            sys.stderr.write("WARNING: Column "+Conversion.col2letter(col+1) +
-                             " in sheet \""+table+"\" is empty, ignoring it\n")
+            self.diagnostics.warn("empty_column", table,
+                                  "Column {} in sheet \"{}\" is empty, ignoring it", Conversion.col2letter(col+1), table)
 
 
 class XlsReader:
 
-    def __init__(self, instance):
+    def __init__(self, instance, only_sheets=None, exclude_sheets=None):
         # Expected worksheets xlsx file and their parsing functions
         self.instance = instance
+        self.only_sheets = only_sheets
+        self.exclude_sheets = exclude_sheets
         self.active_cell = (1, 0)
 
+    def is_selected(self, table):
+        """
+        Checks if a sheet is selected by only_sheets and exclude_sheets
+        """
+        if self.only_sheets != None and table not in self.only_sheets:
+            return False
+        if self.exclude_sheets != None and table in self.exclude_sheets:
+            return False
+        return True
+
+    def get_sheet_parts(self, archive):
+        """
+        Returns the name and the xml part of every sheet
+        listed in the workbook of an xlsx archive
+        """
+        import posixpath
+        import xml.etree.ElementTree as ET
+        ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+              "p": "http://schemas.openxmlformats.org/package/2006/relationships",
+              "c": "http://schemas.openxmlformats.org/package/2006/content-types"}
+        rid = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+        workbook_types = ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+                          "application/vnd.openxmlformats-officedocument.spreadsheetml.template.main+xml",
+                          "application/vnd.ms-excel.sheet.macroEnabled.main+xml",
+                          "application/vnd.ms-excel.template.macroEnabled.main+xml"]
+        # the workbook part is named in the manifest, like openpyxl finds it
+        manifest = ET.fromstring(archive.read("[Content_Types].xml"))
+        workbook_part = None
+        for override in manifest.findall("c:Override", ns):
+            if override.get("ContentType") in workbook_types:
+                workbook_part = override.get("PartName").lstrip("/")
+                break
+        if workbook_part == None:
+            raise ValueError("No workbook found in the xls file")
+        folder, name = posixpath.split(workbook_part)
+        workbook = ET.fromstring(archive.read(workbook_part))
+        rels = ET.fromstring(archive.read(
+            posixpath.join(folder, "_rels", name+".rels")))
+        targets = {}
+        for rel in rels.findall("p:Relationship", ns):
+            targets[rel.get("Id")] = rel.get("Target")
+        parts = []
+        for sheet in workbook.findall("m:sheets/m:sheet", ns):
+            target = targets[sheet.get(rid)]
+            if target.startswith("/"):
+                part = target[1:]
+            else:
+                part = posixpath.normpath(posixpath.join(folder, target))
+            parts.append((sheet.get("name"), part))
+        return parts
+
+    def index(self, input):
+        """
+        Lists the sheets of input excel table with their dimension and the size
+        of their xml part, using only the workbook metadata
+        """
+        import zipfile
+        sheets = []
+        with zipfile.ZipFile(input) as archive:
+            for name, part in self.get_sheet_parts(archive):
+                info = archive.getinfo(part)
+                # the dimension is at the start of the sheet, only decompress its beginning
+                with archive.open(info) as f:
+                    m = re.search(
+                        rb'<(?:\w+:)?dimension ref="([^"]*)"', f.read(4096))
+                sheets.append({"sheet": name,
+                               "dimension": m.group(1).decode() if m != None else None,
+                               "size": info.file_size,
+                               "compressed_size": info.compress_size})
+        return sheets
+
+    def load_workbook(self, input, read_only, excluded_parts):
+        """
+        Loads the workbook without the sheets stored in excluded_parts,
+        they are neither read nor decompressed if openpyxl allows it.
+        This relies on openpyxl's ExcelReader, whose read_worksheets skips
+        every sheet whose part is missing from the archive names listed in
+        ExcelReader.valid_files. Without that attribute the whole workbook
+        is loaded and parse skips the unselected sheets
+        """
+        import openpyxl as xls
+        if len(excluded_parts) == 0:
+            return xls.load_workbook(input, read_only=read_only, data_only=True)
+        from openpyxl.reader.excel import ExcelReader
+        reader = ExcelReader(input, read_only=read_only, data_only=True)
+        if not hasattr(reader, "valid_files"):
+            reader.archive.close()
+            return xls.load_workbook(input, read_only=read_only, data_only=True)
+        reader.valid_files = [
+            f for f in reader.valid_files if f not in excluded_parts]
+        reader.read()
+        return reader.wb
+
     def parse(self, input):
         """
         Parses input excel table
         """
-        wb = xls.load_workbook(input, read_only=True, data_only=True)
+        excluded_parts = []
+        if self.only_sheets != None or self.exclude_sheets != None:
+            import zipfile
+            with zipfile.ZipFile(input) as archive:
+                sheet_parts = self.get_sheet_parts(archive)
+            for name, part in sheet_parts:
+                if not self.is_selected(name):
+                    excluded_parts.append(part)
+                    sys.stderr.write("Skipping Sheet: "+name+"\n")
+        wb = self.load_workbook(input, True, excluded_parts)
         if self.__update_dimensions(wb):
             wb.close()
-            wb = xls.load_workbook(input, read_only=False, data_only=True)
+            wb = self.load_workbook(input, False, excluded_parts)
         for sheet in wb:
+            if not self.is_selected(sheet.title):
+                # already reported, only loaded if openpyxl could not exclude it
+                continue
             style = self.instance.get_table_style(sheet.title)
             if style == "skip":
                 sys.stderr.write("Skipping Sheet: "+sheet.title+"\n")
             else:
                 self.parse_table(sheet, style)
+        self.check_tables()
+
+    def check_tables(self):
+        """
+        Ensures every sheet of the template was parsed and drops empty ones
+        """
         for table in self.instance.template:
+            if not self.is_selected(table):
+                continue
             if table not in self.instance.data:
                 raise ValueError("Sheet \""+table+"\" not found")
             if not self.instance.data[table].__contains__("rows"):
-                sys.stderr.write("WARNING: Sheet \""+table +
-                                 "\" is empty, ignoring it\n")
+                self.instance.diagnostics.warn("empty_sheet", table,
+                                               "Sheet \"{}\" is empty, ignoring it", table)
                 self.instance.data.pop(table)
                 sys.stderr.write("Skipping Sheet: "+table+"\n")
 
     def parse_table(self, sheet, style):
-        table = sheet.title
+        self.parse_rows(sheet.title, style, sheet.iter_rows(min_row=1))
+
+    def parse_rows(self, table, style, rows):
         sys.stderr.write("Parsing Sheet \""+table +
                          "\" with style \""+style+"\"\n")
-        self.instance.add_table(sheet.title)
-        self.instance.add_style(sheet.title, style)
+        self.instance.add_table(table)
+        self.instance.add_style(table, style)
         self.active_cell = (1, 0)
-        self.active_sheet = sheet
+        self.active_sheet = table
         try:
             id = 1
-            for r in sheet.iter_rows(min_row=1):
+            for r in rows:
                 row = self.parse_row(r)
                 self.instance.add_row(table, id, row)
                 id += 1
@@ -631,10 +1003,78 @@ class XlsReader:
         return False
 
 
+class CsvReader(XlsReader):
+    """
+    Reads a csv file as a single sheet named after the file
+    """
+
+    def parse(self, input):
+        """
+        Parses input csv table
+        """
+        table = os.path.splitext(os.path.basename(input))[0]
+        if not self.is_selected(table):
+            style = "skip"
+        else:
+            style = self.instance.get_table_style(table)
+        if style == "skip":
+            sys.stderr.write("Skipping Sheet: "+table+"\n")
+        else:
+            with open(input, "r", newline="", encoding="utf8") as f:
+                rows = list(csv.reader(f))
+            # like openpyxl for a sheet, pad all rows to the same width,
+            # which in row style covers at least every column of the template
+            width = 0
+            if style in ["row", "row_indexed"]:
+                width = len(self.instance.template[table]["types"])
+            for row in rows:
+                width = max(width, len(row))
+            for row in rows:
+                row.extend([""] * (width - len(row)))
+            self.parse_rows(table, style, rows)
+            self.instance.add_text(table)
+        self.check_tables()
+
+    def index(self, input):
+        """
+        Lists the single sheet of input csv table with the size of the file
+        """
+        size = os.path.getsize(input)
+        return [{"sheet": os.path.splitext(os.path.basename(input))[0],
+                 "dimension": None, "size": size, "compressed_size": size}]
+
+    def parse_row(self, row, first=0):
+        cols = []
+        for i in range(first, len(row)):
+            if row[i] == "":
+                cols.append(None)
+            else:
+                cols.append(row[i])
+        return cols
+
+
+def non_negative_int(value):
+    n = int(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError(
+            "must be at least 0, getting: "+value)
+    return n
+
+
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(
+            "must be at least 1, getting: "+value)
+    return n
+
+
 def main():
     # temporal solution, to be removed eventually
     if sys.version_info < (3, 5):
         raise SystemExit('Sorry, this code need Python 3.5 or higher')
+    diagnostics = Diagnostics()
+    args = None
     try:
         parser = argparse.ArgumentParser(
             description="Converts an input table to facts"
@@ -642,31 +1082,91 @@ def main():
         parser.add_argument('--output', '-o', metavar='<file>',
                             help='Write output into %(metavar)s', default=sys.stdout, required=False)
         parser.add_argument('--xls', '-x', metavar='<file>',
-                            help='Read xls file from %(metavar)s', required=True)
+                            help='Read xls file (or a single csv file) from %(metavar)s', required=False)
         parser.add_argument('--template', '-t', metavar='<file>',
                             help='Read template from %(metavar)s', required=True)
+        parser.add_argument('--template-cache', metavar='<file>',
+                            help='Cache the checked template in %(metavar)s for later runs', required=False)
+        parser.add_argument('--check-template', action='store_true',
+                            help='Only check the template, without reading any table')
+        parser.add_argument('--only-sheets', metavar='<sheet>', nargs='+',
+                            help='Only parse the given sheets of the template', required=False)
+        parser.add_argument('--exclude-sheets', metavar='<sheet>', nargs='+',
+                            help='Do not parse the given sheets of the template', required=False)
+        parser.add_argument('--sheet-index', action='store_true',
+                            help='Only list the sheets with their dimension and size, without parsing them')
+        parser.add_argument('--format', choices=['lp', 'aspif'],
+                            help='Write facts as text (lp) or as ground aspif program (default: %(default)s)', default='lp')
+        parser.add_argument('--validate', action='store_true',
+                            help='Only check the types of all cells and report every error, without writing facts')
+        parser.add_argument('--max-errors', metavar='<n>', type=positive_int,
+                            help='Stop validating after %(metavar)s errors (default: %(default)s)', default=100)
+        parser.add_argument('--max-warnings', metavar='<n>', type=non_negative_int,
+                            help='Print at most %(metavar)s warnings of each kind per sheet (default: %(default)s)', default=10)
+        parser.add_argument('--diagnostics', metavar='<file>',
+                            help='Write the warning counts and examples as JSON into %(metavar)s', required=False)
 
         args = parser.parse_args()
+        if args.xls == None and not args.check_template:
+            parser.error("the following arguments are required: --xls/-x")
+        diagnostics.max_examples = args.max_warnings
         tpl = Template()
-        tpl.read(args.template)
-        instance = Instance(tpl.template)
-        reader = XlsReader(instance)
+        if args.template_cache != None:
+            tpl.read_cached(args.template, args.template_cache)
+        else:
+            tpl.read(args.template)
+        for names in [args.only_sheets, args.exclude_sheets]:
+            if names != None:
+                for name in names:
+                    if name not in tpl.template:
+                        parser.error(
+                            "sheet \"{}\" is not defined in the template".format(name))
+        if args.check_template:
+            return 0
+        instance = Instance(tpl.template, diagnostics)
+        if args.xls.lower().endswith(".csv"):
+            reader = CsvReader(instance, args.only_sheets, args.exclude_sheets)
+        else:
+            reader = XlsReader(instance, args.only_sheets, args.exclude_sheets)
+        if args.sheet_index:
+            write_sheet_index(sys.stdout, reader.index(args.xls), reader)
+            return 0
         reader.parse(args.xls)
+        if args.validate:
+            errors, limit_reached = instance.validate(args.max_errors)
+            for e in errors:
+                sys.stderr.write("ERROR: {} {!r}\n".format(*e.args))
+            if limit_reached:
+                sys.stderr.write(
+                    "Stopped after reaching the limit of {} errors\n".format(args.max_errors))
+            if len(errors) > 0:
+                return 1
+            return 0
         instance.correct()
         if args.output == sys.stdout:
-            instance.write(args.output)
+            instance.write(args.output, args.format)
         else:
             with open(args.output, 'w', encoding="utf8") as f:
-                instance.write(f)
+                instance.write(f, args.format)
         return 0
     except Xls2AspError as e:
         sys.stderr.write("*** Exception: {}\n".format(e))
         sys.stderr.write("***   In sheet={0}:{1}{2}\n".format(
-            e.sheet, xls.utils.cell.get_column_letter(e.cell[1]), e.cell[0]))
+            e.sheet, Conversion.col2letter(e.cell[1]), e.cell[0]))
         return 1
     except Exception as e:
+        import traceback
         traceback.print_exception(*sys.exc_info())
         return 1
+    finally:
+        diagnostics.write_summary(sys.stderr)
+        if args != None and args.diagnostics != None:
+            try:
+                with open(args.diagnostics, 'w', encoding="utf8") as f:
+                    diagnostics.write_json(f)
+            except OSError as e:
+                sys.stderr.write(
+                    "*** Could not write diagnostics: {}\n".format(e))
 
 
 if __name__ == '__main__':